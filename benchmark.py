@@ -0,0 +1,247 @@
+#!python
+"""Benchmarks nanosite builds on a synthetic site.
+
+Generates a site with a given number of posts and pages in a temporary
+directory, then times cold builds (no outputs or manifest) and rebuilds
+with nothing changed, reporting wall time, peak memory and throughput.
+
+With --startup, instead times the nanosite command itself for --help and for
+a build with nothing changed, each in a new process, and exits with an error
+if either loads a module it shouldn't need (see [LazyModules]) or takes
+longer than --max-startup milliseconds.
+
+Usage: python benchmark.py [--posts N] [--pages N] [--depth N]
+                           [--body-size KB] [--jobs N] [--repeat N]
+                           [--low-memory] [--keep]
+                           [--startup] [--max-startup MS]
+"""
+
+import sys
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from nanosite_gen import nanosite_gen
+
+Words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur",
+         "adipiscing", "elit", "sed", "do", "eiusmod", "tempor", "incididunt",
+         "ut", "labore", "et", "dolore", "magna", "aliqua", "enim", "minim",
+         "veniam", "quis", "nostrud", "exercitation", "ullamco", "laboris"]
+CategoryBranching = 3   # subcategories per page category
+# modules that neither --help nor a build with nothing changed should load
+LazyModules = ["markdown", "pkg_resources", "concurrent.futures",
+               "http.server", "xml.sax.saxutils"]
+# runs nanosite with the given arguments, then lists the [LazyModules] loaded
+StartupScript = """import sys
+from nanosite_gen import nanosite_gen
+nanosite_gen.main(sys.argv[1:])
+print(" ".join(name for name in {!r} if name in sys.modules))
+""".format(LazyModules)
+
+def make_body(rng, size):
+    """Returns about [size] bytes of Markdown with a mix of paragraphs,
+    headings, lists, emphasis and links."""
+    blocks = []
+    length = 0
+    while length < size:
+        kind = rng.randrange(6)
+        words = [rng.choice(Words) for i in range(rng.randint(20, 80))]
+        if kind == 0:
+            block = "## " + " ".join(words[:5]).title()
+        elif kind == 1:
+            block = "\n".join("* " + " ".join(words[i:i + 6])
+                              for i in range(0, len(words), 6))
+        else:
+            words[3] = "*" + words[3] + "*"
+            words[7] = "[" + words[7] + "](http://example.com/)"
+            block = " ".join(words).capitalize() + "."
+        blocks.append(block)
+        length += len(block) + 2
+    return "\n\n".join(blocks) + "\n"
+
+def category_directories(depth):
+    """Returns the page directories of a category tree [depth] levels deep."""
+    directories = [nanosite_gen.PagesDirectory]
+    level = [nanosite_gen.PagesDirectory]
+    for d in range(depth):
+        level = [parent + "cat{}_{}/".format(d, i) for parent in level
+                 for i in range(CategoryBranching)]
+        directories += level
+    return directories
+
+def make_site(directory, posts, pages, depth, body_size, seed=0):
+    """Writes a synthetic site to [directory] with [posts] posts and [pages]
+    pages spread over a category tree [depth] levels deep. Each post and
+    page has about [body_size] bytes of Markdown."""
+    rng = random.Random(seed)
+    os.chdir(directory)
+    meta = open("meta.md", "w")
+    meta.write("title: Benchmark\ntagline: A synthetic site\n"
+               "author: nanosite\nurl: http://example.com/\n")
+    meta.close()
+
+    package = os.path.dirname(os.path.abspath(nanosite_gen.__file__))
+    os.mkdir(nanosite_gen.TemplatesDirectory)
+    for name in nanosite_gen.Templates:
+        filename = name + "-template.html"
+        shutil.copyfile(os.path.join(package, "templates", filename),
+                        nanosite_gen.TemplatesDirectory + filename)
+    shutil.copyfile(os.path.join(package, "style.css"), "style.css")
+    os.mkdir(nanosite_gen.ArchiveDirectory)
+
+    os.mkdir(nanosite_gen.PostsDirectory)
+    for i in range(posts):
+        # spread posts over the days before a fixed date
+        date = "{}-{:02}-{:02} {:02}:{:02}".format(2000 + i // 336,
+                                                   i // 28 % 12 + 1,
+                                                   i % 28 + 1, i % 24, i % 60)
+        post = open(nanosite_gen.PostsDirectory + "post{}.md".format(i), "w")
+        post.write("title: Post {}\ndate: {}\n\n".format(i, date))
+        post.write(make_body(rng, body_size))
+        post.close()
+
+    directories = category_directories(depth)
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+    for i in range(pages):
+        path = directories[i % len(directories)] + "page{}.md".format(i)
+        page = open(path, "w")
+        page.write("title: Page {}\n\n".format(i))
+        page.write(make_body(rng, body_size))
+        page.close()
+
+def clean_outputs():
+    """Removes the outputs and manifest of the last build, so the next one
+    is a cold build."""
+    for output in nanosite_gen.new_manifest["outputs"]:
+        if os.path.exists(output):
+            os.remove(output)
+    if os.path.exists(nanosite_gen.ManifestFile):
+        os.remove(nanosite_gen.ManifestFile)
+
+def run_build(jobs, low_memory, trace):
+    """Builds the site in the current directory and returns (seconds, peak
+    memory in bytes or None, number of outputs). Memory is only traced if
+    [trace] is True, since tracing slows the build down."""
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    nanosite_gen.gen_site(jobs, low_memory_mode=low_memory)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return (elapsed, peak, len(nanosite_gen.new_manifest["outputs"]))
+
+def benchmark(jobs, low_memory, repeat):
+    """Times cold builds and rebuilds with nothing changed of the site in the
+    current directory, [repeat] times each. Returns a list of (scenario,
+    best seconds, peak memory, outputs) tuples."""
+    results = []
+    for scenario in ["cold", "no-change"]:
+        times = []
+        for i in range(repeat):
+            if scenario == "cold":
+                clean_outputs()
+            times.append(run_build(jobs, low_memory, False)[0])
+        # measure memory separately
+        if scenario == "cold":
+            clean_outputs()
+        elapsed, peak, outputs = run_build(jobs, low_memory, True)
+        results.append((scenario, min(times), peak, outputs))
+    return results
+
+def run_command(args):
+    """Runs nanosite with [args] in a new process in the current directory
+    and returns (seconds, list of [LazyModules] it loaded)."""
+    package = os.path.dirname(os.path.abspath(nanosite_gen.__file__))
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(package))
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", StartupScript] + args,
+                            env=env, stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True).stdout
+    elapsed = time.perf_counter() - start
+    return (elapsed, output.splitlines()[-1].split())
+
+def startup(repeat):
+    """Times nanosite --help and a build with nothing changed of the site in
+    the current directory, [repeat] times each, with every optional stage
+    turned on. Returns a list of (command, best seconds, lazy modules
+    loaded) tuples."""
+    meta = open("meta.md", "a")
+    meta.write("precompress: gzip\nsearch_index: yes\n")
+    meta.close()
+    nanosite_gen.gen_site()
+    results = []
+    for args in [["--help"], ["build"]]:
+        runs = [run_command(args) for i in range(repeat)]
+        results.append(("nanosite " + " ".join(args),
+                        min(elapsed for elapsed, loaded in runs),
+                        runs[-1][1]))
+    return results
+
+def report_startup(results, max_startup):
+    """Prints the [startup] results and returns True if no command loaded
+    a lazy module or took longer than [max_startup] milliseconds (if
+    given)."""
+    ok = True
+    print("{:<18} {:>10}  {}".format("Command", "Time (ms)", "Lazy modules"))
+    for command, elapsed, loaded in results:
+        print("{:<18} {:>10.0f}  {}".format(command, elapsed * 1000,
+                                            " ".join(loaded) or "none"))
+        if loaded:
+            print("error: {} loaded {}".format(command, ", ".join(loaded)))
+            ok = False
+        if max_startup is not None and elapsed * 1000 > max_startup:
+            print("error: {} took longer than {} ms".format(command,
+                                                            max_startup))
+            ok = False
+    return ok
+
+def main(argv):
+    def option(name, default):
+        return int(nanosite_gen.get_option(argv, name, str(default)))
+
+    posts = option("--posts", 1000)
+    pages = option("--pages", 100)
+    depth = option("--depth", 2)
+    body_size = option("--body-size", 2) * 1024
+    jobs = option("--jobs", 1)
+    repeat = option("--repeat", 3)
+
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="nanosite-bench-")
+    try:
+        make_site(directory, posts, pages, depth, body_size)
+        if "--startup" in argv:
+            results = startup(repeat)
+        else:
+            results = benchmark(jobs, "--low-memory" in argv, repeat)
+    finally:
+        os.chdir(cwd)
+        if "--keep" in argv:
+            print("Site kept in " + directory)
+        else:
+            shutil.rmtree(directory)
+
+    if "--startup" in argv:
+        max_startup = nanosite_gen.get_option(argv, "--max-startup", None)
+        if not report_startup(results, max_startup and int(max_startup)):
+            sys.exit(1)
+        return
+
+    print("Site: {} posts, {} pages (depth {}), {} KB bodies, {} job(s)"
+          .format(posts, pages, depth, body_size // 1024, jobs))
+    print("{:<12} {:>10} {:>18} {:>12}".format("Build", "Time (s)",
+                                               "Peak memory (MB)",
+                                               "Outputs/s"))
+    for scenario, elapsed, peak, outputs in results:
+        print("{:<12} {:>10.3f} {:>18.1f} {:>12.0f}".format(
+            scenario, elapsed, peak / 2**20, outputs / elapsed))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
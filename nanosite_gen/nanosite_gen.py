@@ -1,8 +1,18 @@
-import markdown
+# Heavier modules (markdown, the thread and process pools, the HTTP server...)
+# are imported by the functions that use them, so that commands which don't
+# need them, like --help or a build where nothing changed, start quickly.
 import os
+import re
 import datetime
-import pkg_resources
 import shutil
+import collections
+import filecmp
+import functools
+import io
+import time
+import hashlib
+import html
+import json
 
 __version__ = "0.1"
 
@@ -11,34 +21,205 @@ PostsDirectory = "posts/"
 PagesDirectory = "pages/"
 TemplatesDirectory = "templates/"
 ArchiveDirectory = "archive/"
+AssetsDirectory = "assets/"
+SearchDirectory = "search/"
+StyleFile = "style.css"
 Templates = ["footer", "header", "main", "front", "page", "post"]
-FrontMaxPosts = 5      # how many posts to show on front page
+# hooks each template is filled in with, and those it can't do without
+TemplateHooks = {"footer": ["$AUTHOR$"],
+                 "header": ["$SITE_URL$", "$TITLE$", "$TAGLINE$", "$MENU$",
+                            "$SEARCH_SCRIPT$"],
+                 "main": ["$SITE_URL$", "$TITLE$", "$HEADER$", "$CONTENT$",
+                          "$NAV_LINK$", "$NAV_TEXT$", "$FOOTER$",
+                          "$SEARCH_SCRIPT$", "$FEED_LINK$"],
+                 "front": ["$POSTS$"],
+                 "page": ["$PAGE_TITLE$", "$CONTENT$"],
+                 "post": ["$POST_TITLE$", "$POST_CONTENT$", "$POST_DATE$",
+                          "$POST_PERMALINK$"]}
+RequiredHooks = {"main": ["$CONTENT$"], "front": ["$POSTS$"],
+                 "page": ["$CONTENT$"], "post": ["$POST_CONTENT$"]}
+HookPattern = re.compile(r"(\$[A-Z][A-Z0-9_]*\$)")
+AssetTemplates = ["main", "header"]    # templates that can use asset hooks
+# defaults of settings which can be changed in meta.md
+FrontMaxPosts = 5      # how many posts to show on front page (front_max_posts)
+ArchivePageSize = 0    # posts per archive page, 0 for one page
+                       # (archive_page_size)
+FeedMaxPosts = 20      # how many posts to put in feed.xml, 0 for no feed
+                       # (feed_max_posts)
+SitemapMaxUrls = 50000 # most URLs allowed in one sitemap file
+CompressExtensions = [".html", ".css", ".js", ".xml", ".svg", ".json"]
+SidecarExtensions = [".gz", ".br"]     # of the compressed copies
+# words left out of the search index
+StopWords = set(["a", "an", "and", "are", "as", "at", "be", "but", "by",
+                 "for", "from", "has", "have", "in", "is", "it", "its", "of",
+                 "on", "or", "that", "the", "this", "to", "was", "were",
+                 "will", "with"])
+PostsCacheSize = 64    # how many built posts to keep in low-memory mode
+ManifestFile = ".nanosite-manifest.json"   # records inputs of the last build
+PostDatesFile = ".nanosite-dates.json"     # dates of posts without date:
+SearchTermsFile = ".nanosite-search-terms.json"   # words of each document
 
-def insert_attribs(p, attribs):
-    """This is the main mechanism to fill in templates by replacing
-    "hook" strings with the content that should fill them.
-    
-    Keyword arguments:
-    p -- String containing the template to be filled in.
-    attribs -- Dictionary mapping template "hooks"
-               (which will always be in the form $STRING$)
-               to the strings which should replace them."""
-    
-    for attrib in attribs:
-        p = p.replace(attrib, attribs[attrib])
-    return p
+# Timings and cache statistics of the current build, or None when not
+# profiling. See [start_profile].
+profile = None
+def start_profile():
+    """Starts recording timings of the build stages, input and output files,
+    and cache hits and misses."""
+    global profile
+    profile = {"start": time.perf_counter(), "stages": {}, "files": {},
+               "caches": {}, "active": set()}
+
+def profile_time(stage, start, path=None):
+    """Records that [stage] took from [start] (a time.perf_counter() value)
+    until now, and adds it to the time spent on file [path] if given."""
+    if profile is None:
+        return
+    elapsed = time.perf_counter() - start
+    calls, total = profile["stages"].get(stage, (0, 0.0))
+    profile["stages"][stage] = (calls + 1, total + elapsed)
+    if path is not None:
+        profile["files"][path] = profile["files"].get(path, 0.0) + elapsed
+
+def profile_cache(cache, hit):
+    """Records a hit (if [hit] is True) or miss of [cache]."""
+    if profile is None:
+        return
+    hits, misses = profile["caches"].get(cache, (0, 0))
+    profile["caches"][cache] = (hits + 1, misses) if hit else \
+                               (hits, misses + 1)
+
+def profiled(stage):
+    """Decorator recording the time spent in each call of the function as
+    [stage]. Recursive calls are counted as part of the outermost one."""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if profile is None or stage in profile["active"]:
+                return f(*args, **kwargs)
+            profile["active"].add(stage)
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                profile["active"].discard(stage)
+                profile_time(stage, start)
+        return wrapper
+    return decorator
+
+def merge_profile(timings):
+    """Adds [timings], the stage and file timings recorded in a worker
+    process (see [convert_in_worker]), to those of this build."""
+    if profile is None or timings is None:
+        return
+    for stage, (calls, seconds) in timings["stages"].items():
+        old_calls, old_seconds = profile["stages"].get(stage, (0, 0.0))
+        profile["stages"][stage] = (old_calls + calls, old_seconds + seconds)
+    for path, seconds in timings["files"].items():
+        profile["files"][path] = profile["files"].get(path, 0.0) + seconds
+
+def print_profile(slowest=10):
+    """Prints the timings recorded since [start_profile], with the [slowest]
+    files that took longest."""
+    total = time.perf_counter() - profile["start"]
+    print("{:<32} {:>7} {:>10}".format("Stage", "Calls", "Time (s)"))
+    stages = sorted(profile["stages"].items(), key=lambda s: -s[1][1])
+    for stage, (calls, seconds) in stages:
+        print("{:<32} {:>7} {:>10.4f}".format(stage, calls, seconds))
+    print("{:<32} {:>7} {:>10.4f}".format("total", "", total))
+
+    print("\nSlowest files:")
+    files = sorted(profile["files"].items(), key=lambda f: -f[1])
+    for path, seconds in files[:slowest]:
+        print("  {:>10.4f}  {}".format(seconds, path))
+
+    print("\n{:<32} {:>7} {:>10}".format("Cache", "Hits", "Misses"))
+    for cache, (hits, misses) in sorted(profile["caches"].items()):
+        print("{:<32} {:>7} {:>10}".format(cache, hits, misses))
+
+def save_profile(filename):
+    """Writes the timings recorded since [start_profile] to [filename] as
+    JSON, e.g. to track build times in CI."""
+    report = {"total": time.perf_counter() - profile["start"],
+              "stages": {stage: {"calls": calls, "seconds": seconds}
+                         for stage, (calls, seconds)
+                         in profile["stages"].items()},
+              "files": profile["files"],
+              "caches": {cache: {"hits": hits, "misses": misses}
+                         for cache, (hits, misses)
+                         in profile["caches"].items()}}
+    output_file = open(filename, "w")
+    json.dump(report, output_file, indent=2, sort_keys=True)
+    output_file.close()
+
+def compile_template(p):
+    """Splits template string [p] into a list of segments that alternate
+    between literal text (even indices) and hooks (odd indices), so it can
+    be filled in by [render_template] in one pass."""
+    return HookPattern.split(p)
+
+def render_template(template, attribs):
+    """Fills in compiled [template] with [attribs], a dictionary mapping
+    hooks to the strings which should replace them. Each hook is only
+    replaced once, so filled in content is never substituted again. Hooks
+    not in [attribs] are left as they are."""
+    segments = list(template)
+    for i in range(1, len(segments), 2):
+        if segments[i] in attribs:
+            segments[i] = attribs[segments[i]]
+    return "".join(segments)
+
+def hash_template(template):
+    """Returns the hash of the source of compiled [template]."""
+    return hash_string("".join(template))
+
+def check_template(name, template):
+    """Prints a warning for each hook in compiled template [name] that
+    nanosite doesn't fill in, and each required hook it lacks."""
+    hooks = template[1::2]
+    known = set(TemplateHooks[name])
+    if name in AssetTemplates:
+        known |= set(asset_urls)
+    for hook in sorted(set(hooks) - known):
+        print("nanosite: warning: unknown hook {} in {}-template.html"
+              .format(hook, name))
+    for hook in RequiredHooks.get(name, []):
+        if hook not in hooks:
+            print("nanosite: warning: missing hook {} in {}-template.html"
+                  .format(hook, name))
+
+def int_setting(site_meta, key, default):
+    """Returns the integer setting [key] from meta.md, or [default] if it
+    isn't set."""
+    return int(site_meta[key]) if key in site_meta else default
+
+def bool_setting(site_meta, key, default):
+    """Returns the yes/no setting [key] from meta.md, or [default] if it
+    isn't set. "yes", "true", "on" and "1" are True, anything else False."""
+    if key not in site_meta:
+        return default
+    return site_meta[key].strip().lower() in ["yes", "true", "on", "1"]
 
 def load_template(name):
-    """Loads a template in the templates directory with name [name],
-    and corresponding filename [name]-template.html."""
-    return open(TemplatesDirectory + name + "-template.html", "r").read()
+    """Loads and compiles a template in the templates directory with name
+    [name], and corresponding filename [name]-template.html."""
+    template = compile_template(open(TemplatesDirectory + name + \
+                                     "-template.html", "r").read())
+    check_template(name, template)
+    return template
 
+templates_cache = None
+@profiled("load_templates")
 def load_templates():
-    """Load all templates."""
-    templates = {}
-    for name in Templates:
-        templates[name] = load_template(name)
-    return templates
+    """Load all templates. These are cached until [invalidate_caches] is
+    called for a template, so a long-running process (see [serve]) only
+    compiles them again when they change."""
+    global templates_cache
+    profile_cache("templates_cache", templates_cache is not None)
+    if templates_cache is None:
+        templates_cache = {}
+        for name in Templates:
+            templates_cache[name] = load_template(name)
+    return templates_cache
     
 def load_markdown(filename, site_meta=None):
     """Converts a Markdown file to HTML and returns a tuple (html, meta) where
@@ -53,36 +234,261 @@ def load_markdown(filename, site_meta=None):
     The Markdown file also has access to all attributes defined in site_meta,
     which it can access with dollar signs: $attrib$."""
     
+    # setting up Markdown is timed on its own, as it's shared between files
+    start = time.perf_counter()
+    if site_meta is not None:
+        context = get_renderer(site_meta)
+        md = context["markdown"]
+    else:
+        import markdown
+        # Markdown will parse metadata in posts
+        md = markdown.Markdown(extensions = ["markdown.extensions.meta"])
+        profile_time("load_markdown: renderer setup", start)
+
+    start = time.perf_counter()
     file_md = open(filename, "r").read()
-    # Insert attribs from meta, adding surrounding dollar signs
     if site_meta is not None:
-        file_md = insert_attribs(file_md, \
-                                 {"$"+k+"$":v for k, v in site_meta.items()})
+        # Insert attribs from meta
+        file_md = context["attrib_pattern"].sub(
+            lambda m: context["attribs"][m.group(0)], file_md)
+        md.reset()
+    profile_time("load_markdown: site meta", start, filename)
     
-    # Markdown will parse metadata in posts
-    md = markdown.Markdown(extensions = ["markdown.extensions.meta"])
+    start = time.perf_counter()
     html = md.convert(file_md)
     meta = {k: "".join(v) for k, v in md.Meta.items()} \
            if md.Meta is not None else {}
+    profile_time("load_markdown: convert", start, filename)
     return (html, meta)
 
+# Shared by all conversions with the same site meta, in this process (so
+# once per build, or once per worker of [preload_sources]). See
+# [get_renderer].
+renderer = None
+def get_renderer(site_meta):
+    """Returns the rendering context for [site_meta], creating it if it
+    changed since the last call. This is a dictionary holding:
+    markdown -- A Markdown converter with the meta extension and those listed
+                in markdown_extensions in meta.md (comma-separated), which is
+                reset between files rather than set up again for each one.
+    attribs -- Dictionary mapping the $attrib$ form of each site meta
+               property to its value.
+    attrib_pattern -- Regex matching any of these, to substitute them all in
+                      one pass."""
+    global renderer
+    if renderer is not None and renderer["site_meta"] == site_meta:
+        return renderer
+
+    start = time.perf_counter()
+    import markdown
+    extensions = ["markdown.extensions.meta"]
+    if "markdown_extensions" in site_meta:
+        extensions += [name.strip() for name
+                       in site_meta["markdown_extensions"].split(",")
+                       if name.strip()]
+    # Insert attribs from meta, adding surrounding dollar signs
+    attribs = {"$"+k+"$": v for k, v in site_meta.items()}
+    attrib_pattern = re.compile("|".join(re.escape(attrib)
+                                         for attrib in attribs)
+                                if attribs else "(?!)")
+    renderer = {"site_meta": dict(site_meta),
+                "markdown": markdown.Markdown(extensions = extensions),
+                "attribs": attribs,
+                "attrib_pattern": attrib_pattern}
+    profile_time("load_markdown: renderer setup", start)
+    return renderer
+
+# The manifest of the previous build, and the one being recorded by this build.
+# Each has a "sources" dictionary mapping source paths to their fingerprints
+# (mtime, size, hash and parsed meta properties) and an "outputs" dictionary
+# mapping output paths to the dependencies they were last built from.
+old_manifest = {"sources": {}, "outputs": {}}
+new_manifest = {"sources": {}, "outputs": {}}
+def load_manifest():
+    """Loads the manifest of the previous build from [ManifestFile], and
+    starts recording a new one."""
+    global old_manifest, new_manifest
+    old_manifest = {"sources": {}, "outputs": {}}
+    if os.path.isfile(ManifestFile):
+        try:
+            old_manifest = json.load(open(ManifestFile, "r"))
+        except ValueError:
+            pass    # unreadable manifest: do a full build
+    new_manifest = {"sources": {}, "outputs": {}}
+
+def save_manifest():
+    """Writes the manifest recorded by this build to [ManifestFile]."""
+    output_file = open(ManifestFile, "w")
+    json.dump(new_manifest, output_file, sort_keys=True)
+    output_file.close()
+
+def hash_string(s):
+    """Returns the hex digest of string [s], used to fingerprint contents."""
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+def source_record(path, stat=None):
+    """Returns the manifest record of the source file at [path] for this
+    build. The file is only read and hashed if its mtime or size differ from
+    the previous build. [stat] is the result of os.stat on the file, if it
+    is already known."""
+    if path in new_manifest["sources"]:
+        return new_manifest["sources"][path]
+
+    if stat is None:
+        stat = os.stat(path)
+    old = old_manifest["sources"].get(path)
+    if old is not None and old["mtime"] == stat.st_mtime and \
+       old["size"] == stat.st_size:
+        record = dict(old)
+    else:
+        content = open(path, "rb").read()
+        record = {"mtime": stat.st_mtime, "size": stat.st_size,
+                  "hash": hashlib.sha1(content).hexdigest()}
+    new_manifest["sources"][path] = record
+    return record
+
+def source_hash(path):
+    """Returns the content hash of the source file at [path]."""
+    return source_record(path)["hash"]
+
+# If True, the words of each source converted are kept in [search_terms]
+# for the search index. Set by [gen_site] from search_index in meta.md.
+search_enabled = False
+search_terms = {}
+
+# In low-memory mode, converted Markdown isn't kept once it's been used and
+# only the [PostsCacheSize] most recently used posts are kept. Set by
+# [gen_site].
+low_memory = False
+
+markdown_cache = {}
+def cache_source(path, source):
+    """Stores [source], the (html, meta) tuple converted from the file at
+    [path], for the rest of the build (except in low-memory mode) and records
+    its meta properties in the manifest."""
+    if not low_memory:
+        markdown_cache[path] = source
+    record = source_record(path)
+    record["meta"] = source[1]
+    record["site"] = source_hash("meta.md")
+    if search_enabled:
+        search_terms[path] = tokenize(source)
+
+def load_source(path, site_meta):
+    """Same as [load_markdown], but only converts each source once per build
+    and records its meta properties in the manifest."""
+    profile_cache("markdown_cache", path in markdown_cache)
+    if path in markdown_cache:
+        return markdown_cache[path]
+    source = load_markdown(path, site_meta)
+    cache_source(path, source)
+    return source
+
+def convert_in_worker(path, site_meta, profiling):
+    """Runs [load_markdown] in a worker process of [preload_sources].
+    Returns a tuple (source, timings) where [timings] holds the stages and
+    files timed in the worker if [profiling] is True (see [merge_profile]),
+    or None."""
+    global profile
+    profile = None
+    if profiling:
+        start_profile()
+    source = load_markdown(path, site_meta)
+    if not profiling:
+        return (source, None)
+    return (source, {"stages": profile["stages"], "files": profile["files"]})
+
+@profiled("preload_sources")
+def preload_sources(site_meta, paths, jobs):
+    """Converts the sources at [paths] on a pool of [jobs] processes, so the
+    build can then render them from [markdown_cache]. Conversion doesn't
+    depend on any state besides the file and [site_meta], so the result is
+    the same as converting them one by one. When profiling, the time spent
+    in each worker is added to the stages and files it was spent on, so
+    these can add up to more than the time of the build."""
+    paths = [path for path in paths if path not in markdown_cache]
+    if jobs <= 1 or len(paths) <= 1:
+        return
+    import concurrent.futures
+    chunksize = max(1, len(paths) // (jobs * 4))
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        results = executor.map(convert_in_worker, paths,
+                               [site_meta] * len(paths),
+                               [profile is not None] * len(paths),
+                               chunksize=chunksize)
+        for path, (source, timings) in zip(paths, results):
+            merge_profile(timings)
+            cache_source(path, source)
+
+def meta_cached(path):
+    """Returns True if the meta properties of the source at [path] are known
+    without parsing it (see [load_source_meta])."""
+    record = source_record(path)
+    return path in markdown_cache or \
+           ("meta" in record and record.get("site") == source_hash("meta.md"))
+
+def load_source_meta(path, site_meta):
+    """Returns only the meta properties of the source at [path]. If neither
+    the source nor meta.md changed since the last build, these are taken from
+    the manifest without parsing the file."""
+    if path in markdown_cache:
+        return markdown_cache[path][1]
+    profile_cache("manifest meta", meta_cached(path))
+    if meta_cached(path):
+        return source_record(path)["meta"]
+    return load_source(path, site_meta)[1]
+
+def load_site_meta():
+    """Returns the meta properties of meta.md, the site settings. If meta.md
+    didn't change since the last build, these are taken from the manifest, so
+    Markdown isn't even loaded when there is nothing to rebuild."""
+    record = source_record("meta.md")
+    profile_cache("manifest meta", meta_cached("meta.md"))
+    if not meta_cached("meta.md"):
+        record["meta"] = load_markdown("meta.md")[1]
+        record["site"] = record["hash"]
+    return dict(record["meta"])
+
+def output_stale(output, deps):
+    """Records that file [output] is built from [deps], a dictionary mapping
+    the names of its inputs to their hashes. Returns True if the output
+    needs to be (re)written: it is missing, or any of its inputs changed
+    since the last build."""
+    new_manifest["outputs"][output] = deps
+    stale = not os.path.isfile(output) or \
+            old_manifest["outputs"].get(output) != deps
+    profile_cache("outputs up to date", not stale)
+    return stale
+
+def common_deps(site_meta, templates):
+    """Returns the dependencies shared by every page built from the main
+    template: the template itself, meta.md, the asset URLs and the rendered
+    header and footer (which cover their templates and the menu)."""
+    return {"meta.md": source_hash("meta.md"),
+            "main": hash_template(templates["main"]),
+            "assets": hash_string(json.dumps(asset_urls, sort_keys=True)),
+            "header": hash_string(make_header(site_meta, templates)),
+            "footer": hash_string(make_footer(site_meta, templates))}
+
 pages_cache = {}
 def load_pages(site_meta, directory=PagesDirectory):
     """ Loads and returns all of the pages in [directory].
     These are cached so they are only loaded on the first call.
     Precondition: directory name ends with a slash '/'."""
     global pages_cache
+    profile_cache("pages_cache", directory in pages_cache)
     if directory in pages_cache:
         return pages_cache[directory]
     
     # first element is set of directories, recursively loaded;
-    # second element is the files in this directory converted to html
+    # second element is the files in this directory as (html, meta) tuples.
+    # html is None if it wasn't needed yet (see [load_source_meta]).
     pages = [{}, {}]
     for filename in sorted(os.listdir(directory)):
         path = directory + filename
         # only process Markdown files
         if os.path.isfile(path) and os.path.splitext(filename)[1] == ".md":
-            pages[1][filename] = load_markdown(path, site_meta)
+            pages[1][filename] = (None, load_source_meta(path, site_meta))
         elif os.path.isdir(path):
             pages[0][filename] = load_pages(site_meta, directory + \
                                                        filename + "/")
@@ -90,120 +496,302 @@ def load_pages(site_meta, directory=PagesDirectory):
     pages_cache[directory] = pages
     return pages
 
-posts_cache = {}
+def preload_pages(site_meta, jobs=1):
+    """Converts the pages whose meta properties aren't known yet (see
+    [meta_cached]) on [jobs] processes. The menu lists every page, so this
+    has to happen before anything calls [load_pages]."""
+    paths = []
+    for root, dirs, filenames in os.walk(PagesDirectory, followlinks=True):
+        root = root.rstrip("/") + "/"
+        for filename in sorted(filenames):
+            path = root + filename
+            if os.path.splitext(filename)[1] == ".md" and \
+               not meta_cached(path):
+                paths.append(path)
+    preload_sources(site_meta, paths, jobs)
+
+posts_cache = collections.OrderedDict()
 post_titles = {}
 def make_post(site_meta, templates, filename):
     """Builds the post with filename [filename] and returns the completed
     HTML string.
-    These are cached so each page is only built on the first call."""
+    These are cached so each page is only built on the first call (in
+    low-memory mode, only the most recently used ones are kept)."""
     global posts_cache
+    profile_cache("posts_cache", filename in posts_cache)
     if filename in posts_cache:
+        posts_cache.move_to_end(filename)
         return posts_cache[filename]
     
-    post_content, meta = load_markdown(filename, site_meta)
+    post_content, meta = load_source(filename, site_meta)
     post_title = meta["title"] if "title" in meta else ""
     post_titles[os.path.basename(filename)] = post_title
-    post_date = string_of_date(date_of_file(filename))
+    post_date = string_of_date(date_of_post(filename))
     
     name = os.path.splitext(os.path.basename(filename))[0]
     post_attribs = {"$POST_TITLE$": post_title,
                     "$POST_CONTENT$": post_content,
                     "$POST_DATE$": post_date,
-                    "$POST_PERMALINK$": site_meta["url"] + ArchiveDirectory + name + ".html" }
-    post = insert_attribs(templates["post"], post_attribs)
+                    "$POST_PERMALINK$": site_meta["url"] + post_output_path(filename) }
+    post = render_template(templates["post"], post_attribs)
     posts_cache[filename] = post
+    if low_memory and len(posts_cache) > PostsCacheSize:
+        posts_cache.popitem(last=False)
     return post
 
+def post_output_path(filename):
+    """Get the path of the archived post built from [filename]."""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return ArchiveDirectory + name + ".html"
+
 def title_of_post(filename):
     """Get title of post based on its filename"""
     global post_titles
     return post_titles[os.path.basename(filename)]
     
-def date_of_file(filename):
-    """Gets the creation date of the file."""
-    t = os.stat(filename).st_birthtime if os.name != "nt" else \
-        os.path.getctime(filename)
+def date_of_file(filename, stat=None):
+    """Gets the creation date of the file, or its modification date on
+    filesystems that don't record creation dates. [stat] is the result of
+    os.stat on the file, if it is already known."""
+    if stat is None:
+        stat = os.stat(filename)
+    if hasattr(stat, "st_birthtime"):
+        t = stat.st_birthtime
+    elif os.name == "nt":
+        t = stat.st_ctime   # creation time on Windows
+    else:
+        t = stat.st_mtime
     return datetime.datetime.fromtimestamp(t)
 
+def parse_date(s):
+    """Parses the date given in a post's date: meta property, in the form
+    YYYY-MM-DD, optionally followed by HH:MM or HH:MM:SS."""
+    for date_format in ["%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S"]:
+        try:
+            return datetime.datetime.strptime(s.strip(), date_format)
+        except ValueError:
+            pass
+    raise ValueError("invalid date '{}', expected YYYY-MM-DD".format(s))
+
+# Paths of all posts, newest first, and the timestamp of each post.
+# Built once per build by [load_post_index].
+post_index = []
+post_dates = {}
+@profiled("load_post_index")
+def load_post_index(site_meta, jobs=1):
+    """Builds the post index. The posts directory is listed once, and the
+    date of each post is its date: meta property if it has one, or else the
+    creation date of the file the first time it was built. Meta properties
+    are kept in the manifest, so unchanged posts are not parsed to find
+    their date. Creation dates are kept in [PostDatesFile], which unlike the
+    manifest is meant to be kept with the site, so they don't change when
+    the manifest is deleted or the site is checked out somewhere else.
+    Posts that have to be parsed are converted on [jobs] processes."""
+    global post_index
+    paths = []
+    for entry in os.scandir(PostsDirectory):
+        # only process Markdown files
+        if entry.is_file() and os.path.splitext(entry.name)[1] == ".md":
+            path = PostsDirectory + entry.name
+            source_record(path, entry.stat())
+            paths.append(path)
+
+    preload_sources(site_meta, [path for path in paths
+                                if not meta_cached(path)], jobs)
+
+    old_dates = {}
+    if os.path.isfile(PostDatesFile):
+        old_dates = json.load(open(PostDatesFile, "r"))
+    created = {}
+    post_dates.clear()
+    for path in paths:
+        meta = load_source_meta(path, site_meta)
+        if "date" in meta:
+            post_dates[path] = parse_date(meta["date"]).timestamp()
+            continue
+        if path in old_dates:
+            created[path] = old_dates[path]
+        else:
+            created[path] = date_of_file(path).timestamp()
+        post_dates[path] = created[path]
+    if created != old_dates:
+        output_file = open(PostDatesFile, "w")
+        json.dump(created, output_file, indent=2, sort_keys=True)
+        output_file.write("\n")
+        output_file.close()
+    # sort by most recent post
+    post_index = sorted(paths, key=lambda p: (post_dates[p], p), reverse=True)
+
+def date_of_post(path):
+    """Gets the date of the post at [path] (see [load_post_index])."""
+    return datetime.datetime.fromtimestamp(post_dates[path])
+
 def string_of_date(date):
     """Returns formatted string D Mon Y"""
     return "{} {} {}".format(date.day, date.strftime("%b"), date.year)
 
-def make_menu(site_meta, templates, pages, base=True):
-    """Returns navigation bar encapsulated in <nav> element.
-    Built from a list (so <li>, <ul> elements).
-    List items are given class "menu-item"."""
-    menu_item_template = "<li><a href=\"{}\">{}</a></li>"
+def append_segments(segments, more):
+    """Appends [more] to [segments], both lists of segments alternating
+    between literal text and slots (as returned by [compile_template]),
+    merging the literal text where they meet."""
+    segments[-1] += more[0]
+    segments += more[1:]
 
-    menu_string = ""
-    if base:
-        menu_string += "<nav class=\"nav-bar\"><ul>"
-        # Home link
-        site_url = site_meta["url"]
-        menu_string += menu_item_template.format(site_url + "index.html", \
-                                                 "Home")
-    # Directories become categories
+def menu_tree(site_meta, pages):
+    """Returns the menu tree of [pages], as returned by [load_pages]. Each
+    node is a dictionary with the "dirs" of the directory as a sorted list
+    of (name, node) tuples, its "items" as a sorted list of (url, title)
+    tuples, and a "hash" of both, which covers the whole subtree."""
     directories = pages[0]
-    for directory in sorted(directories):
-        menu_string += "<li><a href=\"#\">{}</a>".format(directory)
-        menu_string += "<ul>"
-        menu_string += make_menu(site_meta, templates,
-                                 directories[directory], base=False)
-        menu_string += "</ul></li>"
-
-    # Files
+    dirs = [(directory, menu_tree(site_meta, directories[directory]))
+            for directory in sorted(directories)]
+    items = []
     files = pages[1]
     for filename in sorted(files):
         name = os.path.splitext(filename)[0]
         url = site_meta["url"] + name + ".html"
         meta = files[filename][1]
         title = meta["title"] if "title" in meta else name
-        menu_string += menu_item_template.format(url, title)
+        items.append((url, title))
+    signature = [[name, node["hash"]] for name, node in dirs] + items
+    return {"dirs": dirs, "items": items,
+            "hash": hash_string(json.dumps(signature))}
 
+# Rendered menu fragments of each subtree, by hash of the subtree
+menu_fragments = {}
+def menu_fragment(tree):
+    """Returns the <li> elements of menu [tree] (see [menu_tree]) as a list
+    of segments alternating between literal HTML and the URL of a menu item,
+    placed where its class attribute goes (see [make_header]). Fragments are
+    cached by the hash of their subtree, so only subtrees that changed are
+    rendered again."""
+    profile_cache("menu_fragments", tree["hash"] in menu_fragments)
+    if tree["hash"] in menu_fragments:
+        return menu_fragments[tree["hash"]]
+
+    # Directories become categories
+    segments = [""]
+    for directory, subtree in tree["dirs"]:
+        segments[-1] += "<li><a href=\"#\">{}</a><ul>".format(directory)
+        append_segments(segments, menu_fragment(subtree))
+        segments[-1] += "</ul></li>"
+    # Files
+    for url, title in tree["items"]:
+        append_segments(segments, menu_item(url, title))
+
+    menu_fragments[tree["hash"]] = segments
+    return segments
+
+def menu_item(url, title):
+    """Returns the segments of the menu item linking to [url]."""
+    return ["<li", url, "><a href=\"{}\">{}</a></li>".format(url, title)]
+
+@profiled("make_menu")
+def make_menu_segments(site_meta, pages):
+    """Same as [make_menu], but returns the list of segments described in
+    [menu_fragment]."""
+    segments = ["<nav class=\"nav-bar\"><ul>"]
+    # Home link
+    append_segments(segments, menu_item(site_meta["url"] + "index.html",
+                                        "Home"))
+    append_segments(segments, menu_fragment(menu_tree(site_meta, pages)))
+    segments[-1] += "</ul></nav>"
+    return segments
+
+def make_menu(site_meta, templates, pages, base=True):
+    """Returns navigation bar encapsulated in <nav> element.
+    Built from a list (so <li>, <ul> elements).
+    If [base] is False, only returns the list items of [pages]."""
     if base:
-        menu_string += "</ul></nav>"
-        
-    return menu_string
+        segments = make_menu_segments(site_meta, pages)
+    else:
+        segments = menu_fragment(menu_tree(site_meta, pages))
+    return "".join(segments[::2])
 
 header_cache = None
-def make_header(site_meta, templates):
+header_segments = None
+def make_header(site_meta, templates, active=None):
     """Builds the site header and returns the completed HTML code.
-    This is cached so it's only built on the first call."""
-    global header_cache
-    if header_cache is not None:
+    This is cached so it's only built on the first call.
+    If [active] is the URL of a menu item and menu_active_class is set in
+    meta.md, that item is given this class. This only joins the cached
+    segments of the header again, so it doesn't render the menu."""
+    global header_cache, header_segments
+    profile_cache("header_cache", header_cache is not None)
+    if header_cache is None:
+        menu = make_menu_segments(site_meta, load_pages(site_meta))
+        attribs = {"$SITE_URL$": site_meta["url"],
+                   "$TITLE$": site_meta["title"],
+                   "$TAGLINE$": site_meta["tagline"]}
+        attribs["$SEARCH_SCRIPT$"] = search_script(site_meta)
+        attribs.update(asset_urls)
+        # menu item URLs remain as slots in the header segments
+        header_segments = [""]
+        for i, segment in enumerate(templates["header"]):
+            if i % 2 == 0:
+                header_segments[-1] += segment
+            elif segment == "$MENU$":
+                append_segments(header_segments, menu)
+            else:
+                header_segments[-1] += attribs.get(segment, segment)
+        header_cache = "".join(header_segments[::2])
+
+    if active is None or "menu_active_class" not in site_meta:
         return header_cache
-    
-    menu = make_menu(site_meta, templates, load_pages(site_meta))
-    attribs = {"$SITE_URL$": site_meta["url"],
-               "$TITLE$": site_meta["title"],
-               "$TAGLINE$": site_meta["tagline"],
-               "$MENU$": menu}
-    header_cache = insert_attribs(templates["header"], attribs)
-    return header_cache
+    active_attrib = " class=\"{}\"".format(site_meta["menu_active_class"])
+    segments = list(header_segments)
+    for i in range(1, len(segments), 2):
+        segments[i] = active_attrib if segments[i] == active else ""
+    return "".join(segments)
 
 def sorted_post_paths():
-    """Get the paths of all posts, sorted by date created (newest first)."""
-    paths = []
-    for filename in os.listdir(PostsDirectory):
-        paths.append(PostsDirectory + filename)
-    # sort by most recent post
-    paths = sorted(paths, key=lambda p:date_of_file(p), reverse=True)
-    return paths
+    """Get the paths of all posts, sorted by date (newest first)."""
+    return post_index
     
+def post_deps(site_meta, templates, path):
+    """Returns the dependencies of the rendered post at [path] (see
+    [output_stale])."""
+    return {"post": hash_template(templates["post"]),
+            path: source_hash(path),
+            path + ":date": string_of_date(date_of_post(path))}
+
+def page_deps(site_meta, templates, path):
+    """Returns the dependencies of the page generated from [path]."""
+    deps = common_deps(site_meta, templates)
+    deps["page"] = hash_template(templates["page"])
+    deps[path] = source_hash(path)
+    return deps
+
+def archive_entry_deps(site_meta, templates, path):
+    """Returns the dependencies of the archived post generated from [path]."""
+    deps = common_deps(site_meta, templates)
+    deps.update(post_deps(site_meta, templates, path))
+    return deps
+
+def front_deps(site_meta, templates):
+    """Returns the dependencies of the front page."""
+    deps = common_deps(site_meta, templates)
+    deps["front"] = hash_template(templates["front"])
+    for path in front_post_paths(site_meta):
+        deps.update(post_deps(site_meta, templates, path))
+    return deps
+
+def front_post_paths(site_meta):
+    """Get the paths of the posts shown on the front page."""
+    max_posts = int_setting(site_meta, "front_max_posts", FrontMaxPosts)
+    return sorted_post_paths()[:max_posts]
+
 def make_content_from_posts(site_meta, templates):
     """Builds and concatenates together posts in the posts directory,
-    up to a maximum of [FrontMaxPosts] posts."""
+    up to a maximum of [FrontMaxPosts] posts (or front_max_posts in
+    meta.md)."""
     html = ""
 
-    paths = sorted_post_paths()
-
-    for path in paths[:FrontMaxPosts]:
-        # only process Markdown files
-        if os.path.isfile(path) and os.path.splitext(path)[1] == ".md":
-            # make post
-            post_html = make_post(site_meta, templates, path)
-            # append
-            html += post_html
+    for path in front_post_paths(site_meta):
+        # make post
+        post_html = make_post(site_meta, templates, path)
+        # append
+        html += post_html
 
     return html
 
@@ -212,72 +800,139 @@ def make_footer(site_meta, templates):
     """Builds the site footer and returns the completed HTML code.
     This is cached so it's only built on the first call."""
     global footer_cache
+    profile_cache("footer_cache", footer_cache is not None)
     if footer_cache is not None:
         return footer_cache
     
     attribs = {"$AUTHOR$": site_meta["author"]}
-    footer_cache = insert_attribs(templates["footer"], attribs)
+    footer_cache = render_template(templates["footer"], attribs)
     return footer_cache
 
+# Outputs written (because their content changed) and outputs removed
+# (because their source is gone) by the current build
+written_outputs = []
+removed_outputs = []
+def commit_output(path, temp_path, compare=True):
+    """Replaces output file [path] with [temp_path], which has its new
+    content, unless both are the same. Renaming makes the replacement
+    atomic, so a crashed build never leaves a half-written file behind.
+
+    Keyword arguments:
+    compare -- If False, the caller already knows the content changed, so
+               the files aren't compared."""
+    if compare and os.path.isfile(path) and \
+       filecmp.cmp(path, temp_path, shallow=False):
+        os.remove(temp_path)
+        return
+    os.replace(temp_path, path)
+    written_outputs.append(path)
+
+def write_output(path, content):
+    """Writes [content] (a string, or bytes for binary files) to output file
+    [path], if it changed."""
+    start = time.perf_counter()
+    mode = "b" if isinstance(content, bytes) else ""
+    if os.path.isfile(path) and open(path, "r" + mode).read() == content:
+        profile_time("write", start, path)
+        return
+    output_file = open(path + ".tmp", "w" + mode)
+    output_file.write(content)
+    output_file.close()
+    commit_output(path, path + ".tmp", compare=False)
+    profile_time("write", start, path)
+
+def write_template(path, template, attribs):
+    """Writes compiled [template] filled in with [attribs] (see
+    [render_template]) to output file [path]. In low-memory mode, the
+    segments are written to the file one by one instead of being joined
+    into one string first. Like [write_output], the file is only replaced if
+    its content changed."""
+    if not low_memory:
+        write_output(path, render_template(template, attribs))
+        return
+    start = time.perf_counter()
+    output_file = open(path + ".tmp", "w")
+    for i, segment in enumerate(template):
+        output_file.write(attribs.get(segment, segment) if i % 2 else segment)
+    output_file.close()
+    commit_output(path, path + ".tmp")
+    profile_time("write", start, path)
+
+@profiled("gen_front")
 def gen_front(site_meta, templates):
-    """Builds the front page and writes to index.html."""
+    """Builds the front page and writes to index.html, if any of its inputs
+    changed since the last build."""
+
+    if not output_stale("index.html", front_deps(site_meta, templates)):
+        return
 
-    content = insert_attribs(templates["front"],
+    content = render_template(templates["front"],
                              {"$POSTS$":
                               make_content_from_posts(site_meta, templates)})
     
     attribs = {"$SITE_URL$": site_meta["url"],
                "$TITLE$": site_meta["title"],
-               "$HEADER$": make_header(site_meta, templates),
+               "$HEADER$": make_header(site_meta, templates,
+                                       site_meta["url"] + "index.html"),
                "$CONTENT$": content,
                "$NAV_LINK$": site_meta["url"] + "archive.html",
                "$NAV_TEXT$": "View older posts.",
-               "$FOOTER$": make_footer(site_meta, templates)}
-    page = insert_attribs(templates["main"], attribs)
+               "$FOOTER$": make_footer(site_meta, templates),
+               "$SEARCH_SCRIPT$": search_script(site_meta),
+               "$FEED_LINK$": feed_link(site_meta)}
+    attribs.update(asset_urls)
+    write_template("index.html", templates["main"], attribs)
 
-    output_file = open("index.html", "w")
-    output_file.write(page)
-    output_file.close()
-
-def gen_page(site_meta, templates, filename, page):
+@profiled("gen_page")
+def gen_page(site_meta, templates, filename, page, nav=None):
     """Generates the page with filename [filename] and contents [page] in the
-    form of the (html, meta) tuple outputted by [load_markdown]."""
+    form of the (html, meta) tuple outputted by [load_markdown].
+    [nav] is the (link, text) tuple of the bottom navigation link, which
+    returns to the front page by default."""
     
     html, meta = page
     name = os.path.splitext(filename)[0]
     page_title = meta["title"] if "title" in meta else name
     attribs = {"$PAGE_TITLE$": page_title,
                "$CONTENT$": html}
-    content = insert_attribs(templates["page"], attribs)
+    content = render_template(templates["page"], attribs)
 
     attribs = {"$SITE_URL$": site_meta["url"],
                "$TITLE$": site_meta["title"],
-               "$HEADER$": make_header(site_meta, templates),
+               "$HEADER$": make_header(site_meta, templates,
+                                       site_meta["url"] + name + ".html"),
                "$CONTENT$": content,
-               "$NAV_LINK$": site_meta["url"],
-               "$NAV_TEXT$": "Return to home.",
-               "$FOOTER$": make_footer(site_meta, templates)}
-    page_output = insert_attribs(templates["main"], attribs)
-    
-    output_file = open(name + ".html", "w")
-    output_file.write(page_output)
-    output_file.close()
+               "$NAV_LINK$": nav[0] if nav else site_meta["url"],
+               "$NAV_TEXT$": nav[1] if nav else "Return to home.",
+               "$FOOTER$": make_footer(site_meta, templates),
+               "$SEARCH_SCRIPT$": search_script(site_meta),
+               "$FEED_LINK$": feed_link(site_meta)}
+    attribs.update(asset_urls)
+    write_template(name + ".html", templates["main"], attribs)
 
-def gen_pages(site_meta, templates, pages=None):
-    """Generate all pages.
-    Set the [pages] parameter to generate only specific pages."""
+@profiled("gen_pages")
+def gen_pages(site_meta, templates, pages=None, directory=PagesDirectory):
+    """Generate all pages whose inputs changed since the last build.
+    Set the [pages] parameter to generate only specific pages, found in
+    [directory]."""
     
     if not pages:
         pages = load_pages(site_meta)
         
     directories = pages[0]
-    for directory in directories:
-        gen_pages(site_meta, templates, directories[directory])
+    for subdirectory in directories:
+        gen_pages(site_meta, templates, directories[subdirectory],
+                  directory + subdirectory + "/")
 
     files = pages[1]
     for filename in files:
-        gen_page(site_meta, templates, filename, files[filename])
+        path = directory + filename
+        output_path = os.path.splitext(filename)[0] + ".html"
+        if output_stale(output_path, page_deps(site_meta, templates, path)):
+            gen_page(site_meta, templates, filename,
+                     load_source(path, site_meta))
 
+@profiled("gen_archive_entry")
 def gen_archive_entry(site_meta, templates, path):
     attribs = {"$SITE_URL$": site_meta["url"],
                "$TITLE$": site_meta["title"],
@@ -285,45 +940,681 @@ def gen_archive_entry(site_meta, templates, path):
                "$CONTENT$": make_post(site_meta, templates, path),
                "$NAV_LINK$": site_meta["url"] + "archive.html",
                "$NAV_TEXT$": "Return to archives.",
-               "$FOOTER$": make_footer(site_meta, templates)}
-    page = insert_attribs(templates["main"], attribs)
+               "$FOOTER$": make_footer(site_meta, templates),
+               "$SEARCH_SCRIPT$": search_script(site_meta),
+               "$FEED_LINK$": feed_link(site_meta)}
+    attribs.update(asset_urls)
     name = os.path.splitext(os.path.basename(path))[0]
-    output_file = open(ArchiveDirectory + name + ".html", "w")
-    output_file.write(page)
-    output_file.close()
+    write_template(ArchiveDirectory + name + ".html", templates["main"],
+                   attribs)
     
+def archive_page_path(number, count):
+    """Get the path of page [number] out of [count] archive index pages.
+    Pages are numbered from the oldest, so adding posts doesn't change the
+    older pages. The newest page is archive.html."""
+    if number == count:
+        return "archive.html"
+    return ArchiveDirectory + "page/{}.html".format(number)
+
+@profiled("gen_archive_index")
+def gen_archive_index(site_meta, templates, entries):
+    """Generate the archive index: archive.html, followed by older pages
+    archive/page/N.html if archive_page_size is set in meta.md. Only pages
+    whose list of posts changed are rewritten.
+
+    Keyword arguments:
+    entries -- List of (title, url) tuples of all posts, newest first."""
+    size = int_setting(site_meta, "archive_page_size", ArchivePageSize)
+    entries = entries[::-1]     # pages are filled from the oldest post
+    if size > 0 and entries:
+        chunks = [entries[i:i + size] for i in range(0, len(entries), size)]
+    else:
+        chunks = [entries]
+    count = len(chunks)
+    if count > 1 and not os.path.isdir(ArchiveDirectory + "page"):
+        os.mkdir(ArchiveDirectory + "page")
+
+    for number, chunk in enumerate(chunks, 1):
+        html = ""
+        if chunk:
+            html = "<ul>\n"
+            for title, url in reversed(chunk):
+                html += "<li><a href=\"{}\">{}</a></li>\n".format(url, title)
+            html += "</ul>"
+
+        # links to the neighbouring pages
+        older = site_meta["url"] + archive_page_path(number - 1, count) \
+                if number > 1 else None
+        newer = site_meta["url"] + archive_page_path(number + 1, count) \
+                if number < count else None
+        if older or newer:
+            html += "\n<div class=\"archive-pages\">"
+            if newer:
+                html += "<a href=\"{}\">Newer posts</a> ".format(newer)
+            if older:
+                html += "<a href=\"{}\">Older posts</a>".format(older)
+            html += "</div>"
+        nav = (older, "View older posts.") if older else None
+
+        # no page count in the title, so older pages stay the same when
+        # new pages are added
+        title = "Archive" if number == count else \
+                "Archive, page {}".format(number)
+
+        output_path = archive_page_path(number, count)
+        deps = common_deps(site_meta, templates)
+        deps["page"] = hash_template(templates["page"])
+        deps["index"] = hash_string(title + html)
+        if not output_stale(output_path, deps):
+            continue
+        gen_page(site_meta, templates, output_path, (html, {"title": title}),
+                 nav)
+
+@profiled("gen_archive")
 def gen_archive(site_meta, templates):
     """Generate the post archive:
     - Build all posts and put in archive folder.
-    - Generate archive.html with links to all posts."""
+    - Generate the archive index with links to all posts."""
     
-    # Archive posts and build archive_md (formatted list of post links)
-    archive_md = ""
+    # Archive posts and build entries (list of post links)
+    entries = []
     for path in sorted_post_paths():
-        gen_archive_entry(site_meta, templates, path)
-        
         name = os.path.splitext(os.path.basename(path))[0]
         output_path = ArchiveDirectory + name + ".html"
 
+        deps = archive_entry_deps(site_meta, templates, path)
+        if output_stale(output_path, deps):
+            gen_archive_entry(site_meta, templates, path)
+        else:
+            # title is still needed for the archive index
+            meta = load_source_meta(path, site_meta)
+            post_titles[os.path.basename(path)] = \
+                meta["title"] if "title" in meta else ""
+
         title = title_of_post(path)
         url = site_meta["url"] + output_path
-        archive_md += "* [{}]({})\n".format(title, url)
+        entries.append((title, url))
+
+    gen_archive_index(site_meta, templates, entries)
+
+def iso_date(timestamp):
+    """Formats [timestamp] as an RFC 3339 date in UTC, as used in feeds."""
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc) \
+           .isoformat()
+
+def feed_link(site_meta):
+    """Returns the <link> element filling in the $FEED_LINK$ hook, or nothing
+    if the feed is turned off (see [gen_feed])."""
+    if int_setting(site_meta, "feed_max_posts", FeedMaxPosts) <= 0:
+        return ""
+    return "<link rel=\"alternate\" type=\"application/atom+xml\" " \
+           "href=\"{}feed.xml\">".format(site_meta["url"])
+
+@profiled("gen_feed")
+def gen_feed(site_meta):
+    """Generates feed.xml, an Atom feed of the newest posts. It's built from
+    the titles and dates already known from building the archive, so posts
+    aren't converted again. A summary: meta property is included if set."""
+    max_posts = int_setting(site_meta, "feed_max_posts", FeedMaxPosts)
+    if max_posts <= 0:
+        return
+    paths = sorted_post_paths()[:max_posts]
+    entries = []
+    for path in paths:
+        meta = load_source_meta(path, site_meta)
+        entries.append((title_of_post(path),
+                        site_meta["url"] + post_output_path(path),
+                        iso_date(post_dates[path]),
+                        meta["summary"] if "summary" in meta else None))
+
+    deps = {"meta.md": source_hash("meta.md"),
+            "entries": hash_string(json.dumps(entries))}
+    if not output_stale("feed.xml", deps):
+        return
+
+    import xml.sax.saxutils
+    escape = xml.sax.saxutils.escape
+    updated = entries[0][2] if entries else iso_date(0)
+    xml_string = "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n"
+    xml_string += "<feed xmlns=\"http://www.w3.org/2005/Atom\">\n"
+    xml_string += "  <title>{}</title>\n".format(escape(site_meta["title"]))
+    xml_string += "  <subtitle>{}</subtitle>\n".format(
+        escape(site_meta["tagline"]))
+    xml_string += "  <link href=\"{}\"/>\n".format(escape(site_meta["url"]))
+    xml_string += "  <link rel=\"self\" href=\"{}feed.xml\"/>\n".format(
+        escape(site_meta["url"]))
+    xml_string += "  <id>{}</id>\n".format(escape(site_meta["url"]))
+    xml_string += "  <updated>{}</updated>\n".format(updated)
+    xml_string += "  <author><name>{}</name></author>\n".format(
+        escape(site_meta["author"]))
+    for title, url, date, summary in entries:
+        xml_string += "  <entry>\n"
+        xml_string += "    <title>{}</title>\n".format(escape(title))
+        xml_string += "    <link href=\"{}\"/>\n".format(escape(url))
+        xml_string += "    <id>{}</id>\n".format(escape(url))
+        xml_string += "    <updated>{}</updated>\n".format(date)
+        if summary is not None:
+            xml_string += "    <summary>{}</summary>\n".format(escape(summary))
+        xml_string += "  </entry>\n"
+    xml_string += "</feed>\n"
+    write_output("feed.xml", xml_string)
+
+@profiled("gen_sitemap")
+def gen_sitemap(site_meta):
+    """Generates sitemap.xml, listing the URLs of all pages built. If there
+    are more than [SitemapMaxUrls], sitemap.xml is a sitemap index of
+    sitemap-N.xml files. Posts are listed last, oldest first, so new posts
+    only change the last file. Only files whose URLs changed are written."""
+    site_url = site_meta["url"]
+    urls = [(site_url, None)]
+    for path in page_paths(load_pages(site_meta)):
+        name = os.path.splitext(os.path.basename(path))[0]
+        urls.append((site_url + name + ".html", None))
+    for output in sorted(new_manifest["outputs"]):
+        if output == "archive.html" or \
+           output.startswith(ArchiveDirectory + "page/"):
+            urls.append((site_url + output, None))
+    for path in reversed(sorted_post_paths()):
+        date = date_of_post(path).strftime("%Y-%m-%d")
+        urls.append((site_url + post_output_path(path), date))
+
+    header = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
+    namespace = "http://www.sitemaps.org/schemas/sitemap/0.9"
+    chunks = [urls[i:i + SitemapMaxUrls]
+              for i in range(0, len(urls), SitemapMaxUrls)]
+    for number, chunk in enumerate(chunks, 1):
+        output_path = "sitemap.xml" if len(chunks) == 1 else \
+                      "sitemap-{}.xml".format(number)
+        if not output_stale(output_path,
+                            {"urls": hash_string(json.dumps(chunk))}):
+            continue
+        import xml.sax.saxutils
+        escape = xml.sax.saxutils.escape
+        xml_string = header + "<urlset xmlns=\"{}\">\n".format(namespace)
+        for url, date in chunk:
+            xml_string += "  <url><loc>{}</loc>".format(escape(url))
+            if date is not None:
+                xml_string += "<lastmod>{}</lastmod>".format(date)
+            xml_string += "</url>\n"
+        xml_string += "</urlset>\n"
+        write_output(output_path, xml_string)
+
+    if len(chunks) > 1:
+        if not output_stale("sitemap.xml", {"shards": len(chunks),
+                                            "url": site_url}):
+            return
+        import xml.sax.saxutils
+        escape = xml.sax.saxutils.escape
+        xml_string = header + "<sitemapindex xmlns=\"{}\">\n".format(
+            namespace)
+        for number in range(1, len(chunks) + 1):
+            xml_string += "  <sitemap><loc>{}sitemap-{}.xml</loc>" \
+                          "</sitemap>\n".format(escape(site_url), number)
+        xml_string += "</sitemapindex>\n"
+        write_output("sitemap.xml", xml_string)
+
+def page_paths(pages, directory=PagesDirectory):
+    """Get the paths of all pages in [pages], as returned by [load_pages]
+    for [directory]."""
+    paths = []
+    directories = pages[0]
+    for subdirectory in sorted(directories):
+        paths += page_paths(directories[subdirectory],
+                            directory + subdirectory + "/")
+    for filename in sorted(pages[1]):
+        paths.append(directory + filename)
+    return paths
 
-    # Create archive page based on page template
-    archive_html = markdown.markdown(archive_md)
-    gen_page(site_meta, templates, "archive.html",
-             (archive_html, {"title": "Archive"}))
+def stale_sources(site_meta, templates):
+    """Get the paths of all posts and pages that have to be converted to
+    build their stale outputs."""
+    paths = []
+    if output_stale("index.html", front_deps(site_meta, templates)):
+        paths += front_post_paths(site_meta)
+    for path in page_paths(load_pages(site_meta)):
+        output_path = os.path.splitext(os.path.basename(path))[0] + ".html"
+        if output_stale(output_path, page_deps(site_meta, templates, path)):
+            paths.append(path)
+    for path in sorted_post_paths():
+        name = os.path.splitext(os.path.basename(path))[0]
+        output_path = ArchiveDirectory + name + ".html"
+        if output_stale(output_path,
+                        archive_entry_deps(site_meta, templates, path)):
+            paths.append(path)
+    return paths
+
+# Asset URLs of this build, by the template hook they're available as.
+# See [gen_assets].
+asset_urls = {}
+# matches the name of a fingerprinted copy made by [gen_assets], e.g.
+# logo.4effda12.png, capturing the name of its source (logo.png)
+AssetCopyPattern = re.compile(r"^(.*)\.[0-9a-f]{8}(\.[^.]*)?$")
+def asset_paths():
+    """Get the paths of all assets: style.css and the files in
+    [AssetsDirectory], except fingerprinted copies made by [gen_assets] and
+    their compressed sidecars (see [gen_compressed]). Copies are recognized
+    by their name next to their source, so this doesn't depend on the
+    manifest."""
+    paths = [StyleFile] if os.path.isfile(StyleFile) else []
+    for root, dirs, filenames in os.walk(AssetsDirectory):
+        root = root.rstrip("/") + "/"
+        names = set(filenames)
+        for filename in sorted(filenames):
+            path = root + filename
+            name, extension = os.path.splitext(filename)
+            if extension in SidecarExtensions and name in names:
+                filename = name     # a sidecar is a copy if its file is
+            match = AssetCopyPattern.match(filename)
+            if match and match.group(1) + (match.group(2) or "") in names:
+                continue
+            if path not in old_manifest["outputs"] and \
+               path not in new_manifest["outputs"] and \
+               os.path.splitext(path)[1] != ".tmp":
+                paths.append(path)
+    return paths
+
+def asset_hook(path):
+    """Get the template hook of the asset at [path], e.g. $ASSET_STYLE_CSS$,
+    or $ASSET_IMG_LOGO_PNG$ for assets/img/logo.png."""
+    if path.startswith(AssetsDirectory):
+        path = path[len(AssetsDirectory):]
+    return "$ASSET_" + re.sub("[^A-Za-z0-9]", "_", path).upper() + "$"
+
+def minify_css(css):
+    """Returns [css] without comments and unneeded whitespace."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+@profiled("gen_assets")
+def gen_assets(site_meta):
+    """Processes the assets (see [asset_paths]). CSS is minified, and each
+    asset is copied to a name containing a hash of its content, e.g.
+    style.3fa9c1d2.css, so it can be cached forever. Its URL is available
+    to the main and header templates as its hook (see [asset_hook]).
+    Assets that didn't change since the last build aren't processed again.
+    If two assets have the same hook, only the first one is used."""
+    asset_urls.clear()
+    asset_sources = {}
+    for path in asset_paths():
+        hook = asset_hook(path)
+        if hook in asset_sources:
+            print("nanosite: warning: {} and {} both have the hook {}; "
+                  "ignoring {}".format(asset_sources[hook], path, hook, path))
+            continue
+        asset_sources[hook] = path
+        record = source_record(path)
+        output_path = record.get("asset")
+        if output_path is None or not os.path.isfile(output_path):
+            content = open(path, "rb").read()
+            if os.path.splitext(path)[1] == ".css":
+                content = minify_css(content.decode("utf-8")).encode("utf-8")
+            name, extension = os.path.splitext(path)
+            output_path = "{}.{}{}".format(
+                name, hashlib.sha1(content).hexdigest()[:8], extension)
+            write_output(output_path, content)
+            record["asset"] = output_path
+        output_stale(output_path, {path: record["hash"]})
+        asset_urls[hook] = site_meta["url"] + output_path
+
+def gzip_bytes(data):
+    """Returns [data] compressed with gzip. No timestamp is stored, so the
+    same data always compresses to the same bytes."""
+    import gzip
+    buffer = io.BytesIO()
+    gzip_file = gzip.GzipFile(filename="", mode="wb", compresslevel=9,
+                              fileobj=buffer, mtime=0)
+    gzip_file.write(data)
+    gzip_file.close()
+    return buffer.getvalue()
+
+def compressors(site_meta):
+    """Returns a list of (extension, function) tuples of the formats listed
+    in precompress in meta.md: "gzip", and "br" if the brotli module is
+    installed."""
+    formats = site_meta["precompress"].split(",") \
+              if "precompress" in site_meta else []
+    result = []
+    for name in [name.strip() for name in formats]:
+        if name == "gzip":
+            result.append((".gz", gzip_bytes))
+        elif name == "br":
+            try:
+                import brotli
+            except ImportError:
+                print("nanosite: warning: the brotli module is needed to "
+                      "precompress with br")
+                continue
+            result.append((".br", brotli.compress))
+        elif name:
+            print("nanosite: warning: unknown precompress format " + name)
+    return result
+
+@profiled("gen_compressed")
+def gen_compressed(site_meta):
+    """If precompress is set in meta.md, writes a compressed copy of each
+    HTML, CSS, JS, XML, SVG and JSON output next to it (e.g. index.html.gz),
+    for servers that can send these directly. Only outputs that changed in
+    this build are compressed again. Compression runs on a thread pool, as
+    zlib releases the GIL while it works."""
+    formats = compressors(site_meta)
+    if not formats:
+        return
+    changed = set(written_outputs)
+    tasks = []
+    for output in list(new_manifest["outputs"]):
+        if os.path.splitext(output)[1] not in CompressExtensions:
+            continue
+        for extension, compress in formats:
+            sidecar = output + extension
+            if output_stale(sidecar, {"source": output}) or output in changed:
+                tasks.append((sidecar, output, compress))
+    if not tasks:
+        return
+
+    def run(task):
+        sidecar, output, compress = task
+        return compress(open(output, "rb").read())
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(os.cpu_count() or 1) \
+         as executor:
+        for task, data in zip(tasks, executor.map(run, tasks)):
+            write_output(task[0], data)
+
+def tokenize(source):
+    """Returns the sorted list of distinct words in [source], an (html, meta)
+    tuple, for the search index. Tags, stop words and one-letter words are
+    left out."""
+    html_string, meta = source
+    text = html.unescape(re.sub(r"<[^>]*>", " ", html_string))
+    if "title" in meta:
+        text += " " + meta["title"]
+    terms = set(re.findall(r"\w+", text.lower()))
+    return sorted(term for term in terms
+                  if len(term) > 1 and term not in StopWords)
+
+def search_script(site_meta):
+    """Returns the <script> element filling in the $SEARCH_SCRIPT$ hook, or
+    nothing if the search index is turned off."""
+    if not search_enabled:
+        return ""
+    url = site_meta["url"] + SearchDirectory
+    return "<script src=\"{}search.js\" data-index=\"{}\"></script>" \
+           .format(url, url)
+
+def search_shard(term):
+    """Get the name of the search index shard holding [term]."""
+    return term[0] if re.match("[a-z0-9]", term) else "_"
+
+@profiled("gen_search_index")
+def gen_search_index(site_meta):
+    """If search_index is turned on in meta.md, generates the client-side search
+    index in [SearchDirectory]: docs.json lists the [title, url] of each
+    post and page once, by ID, along with the [StopWords] left out of the
+    index, and a shard per first letter (a.json, b.json, ..., _.json for
+    anything else) maps each word to the IDs of the documents containing
+    it. search.js looks words up in them.
+    The words of each document are kept in [SearchTermsFile], which is only
+    read when the index is rebuilt, and documents keep their IDs between
+    builds, so only shards with changed words are rewritten, and nothing is
+    rebuilt if no document changed."""
+    if not search_enabled:
+        return
+    if not os.path.isdir(SearchDirectory):
+        os.mkdir(SearchDirectory)
+
+    docs = []   # (path, title, url) of posts, then pages
+    for path in sorted_post_paths():
+        docs.append((path, title_of_post(path),
+                     site_meta["url"] + post_output_path(path)))
+    pages = load_pages(site_meta)
+    for path in page_paths(pages):
+        meta = load_source_meta(path, site_meta)
+        name = os.path.splitext(os.path.basename(path))[0]
+        docs.append((path, meta["title"] if "title" in meta else name,
+                     site_meta["url"] + name + ".html"))
+
+    # documents keep their IDs; new ones take the lowest free ones
+    old_ids = old_manifest.get("search_ids", {})
+    ids = {path: old_ids[path] for path, title, url in docs
+           if path in old_ids}
+    used = set(ids.values())
+    free = (i for i in range(len(docs) + len(used)) if i not in used)
+    for path, title, url in docs:
+        if path not in ids:
+            ids[path] = next(free)
+    new_manifest["search_ids"] = ids
+
+    signature = [[ids[path], title, url, source_hash(path)]
+                 for path, title, url in docs]
+    deps = {"docs": hash_string(json.dumps(signature)),
+            "site": source_hash("meta.md")}
+    outputs = [output for output in old_manifest["outputs"]
+               if output.startswith(SearchDirectory)]
+    if outputs and all(old_manifest["outputs"][output] == deps and
+                       os.path.isfile(output) for output in outputs):
+        for output in outputs:
+            output_stale(output, deps)
+        return
+
+    # words of the documents that weren't converted in this build
+    old_terms = {}
+    if os.path.isfile(SearchTermsFile):
+        try:
+            old_terms = json.load(open(SearchTermsFile, "r"))
+        except ValueError:
+            pass    # unreadable: convert the documents again
+    doc_list = [None] * (max(ids.values()) + 1 if ids else 0)
+    shards = {}
+    terms_file = {}
+    for path, title, url in docs:
+        doc_list[ids[path]] = [title, url]
+        entry = {"hash": source_hash(path), "site": source_hash("meta.md")}
+        old = old_terms.get(path)
+        if path not in search_terms:
+            if old is not None and old["hash"] == entry["hash"] and \
+               old["site"] == entry["site"]:
+                search_terms[path] = old["terms"]
+            else:
+                search_terms[path] = tokenize(load_source(path, site_meta))
+        entry["terms"] = search_terms[path]
+        terms_file[path] = entry
+        for term in entry["terms"]:
+            shard = shards.setdefault(search_shard(term), {})
+            shard.setdefault(term, []).append(ids[path])
+    output_file = open(SearchTermsFile, "w")
+    json.dump(terms_file, output_file, sort_keys=True)
+    output_file.close()
+
+    outputs = {"docs": {"docs": doc_list, "stop_words": sorted(StopWords)}}
+    for name, shard in shards.items():
+        outputs[name] = {term: sorted(shard[term]) for term in shard}
+    for name, content in outputs.items():
+        output_path = SearchDirectory + name + ".json"
+        output_stale(output_path, deps)
+        write_output(output_path, json.dumps(content, sort_keys=True,
+                                             separators=(",", ":")))
+    script = open(os.path.join(os.path.dirname(__file__), "search.js"),
+                  "r").read()
+    output_stale(SearchDirectory + "search.js", deps)
+    write_output(SearchDirectory + "search.js", script)
+
+def prune_outputs():
+    """Removes the outputs of the last build that this build no longer
+    produces, e.g. because their post or page was deleted."""
+    for output in sorted(old_manifest["outputs"]):
+        if output not in new_manifest["outputs"] and os.path.isfile(output):
+            os.remove(output)
+            removed_outputs.append(output)
+
+def invalidate_caches(paths=None):
+    """Drops the cached posts, pages, header and footer that were built from
+    any of the source files at [paths], so that a long-running process (see
+    [serve]) doesn't keep serving stale output. Drops everything if [paths]
+    is None."""
+    global header_cache, footer_cache, templates_cache
+    if paths is None:
+        templates_cache = None
+    if paths is None or "meta.md" in paths:
+        markdown_cache.clear()
+        pages_cache.clear()
+        posts_cache.clear()
+        post_titles.clear()
+        header_cache = None
+        footer_cache = None
+        menu_fragments.clear()
+        return
+
+    for path in paths:
+        if path.startswith(TemplatesDirectory):
+            templates_cache = None
+            posts_cache.clear()
+            header_cache = None
+            footer_cache = None
+        elif path.startswith(PagesDirectory):
+            # the menu lists every page
+            markdown_cache.pop(path, None)
+            pages_cache.clear()
+            header_cache = None
+        elif path.startswith(PostsDirectory):
+            markdown_cache.pop(path, None)
+            posts_cache.pop(path, None)
+            post_titles.pop(os.path.basename(path), None)
+        else:
+            # assets can be used in the header
+            header_cache = None
+
+def gen_site(jobs=1, changed=None, site_url=None, low_memory_mode=False):
+    """Builds the site. Only outputs whose inputs changed since the last
+    build, as recorded in [ManifestFile], are rewritten.
+
+    Keyword arguments:
+    jobs -- If more than 1, Markdown is converted on that many processes.
+    changed -- Paths of the source files that changed since the last call,
+               whose cached data is dropped. If None, nothing cached in
+               memory is reused.
+    site_url -- If given, overrides the url in meta.md.
+    low_memory_mode -- If True, memory use doesn't grow with the size of the
+                       site: pages are streamed to their files and converted
+                       Markdown isn't kept, at the cost of converting new
+                       posts twice (once to find their date and title).
+
+    Returns a dictionary with the number of outputs that "changed", were
+    "unchanged" and were "removed"."""
+    global low_memory, search_enabled
+    low_memory = low_memory_mode
+    load_manifest()
+    del written_outputs[:]
+    del removed_outputs[:]
+    search_terms.clear()
+    invalidate_caches(changed)
 
-def gen_site():
     # Load settings as meta attributes from "meta.md"
     # Note: All URLs must have trailing slash
-    site_meta = load_markdown("meta.md")[1]  # get meta info only
+    site_meta = load_site_meta()
+    if site_url is not None:
+        site_meta["url"] = site_url
+    search_enabled = bool_setting(site_meta, "search_index", False)
     
+    gen_assets(site_meta)
     templates = load_templates()
+    load_post_index(site_meta, jobs)
+    preload_pages(site_meta, jobs)
+
+    if jobs > 1 and not low_memory:
+        preload_sources(site_meta, stale_sources(site_meta, templates), jobs)
 
     gen_front(site_meta, templates)
     gen_pages(site_meta, templates)
     gen_archive(site_meta, templates)
+    gen_feed(site_meta)
+    gen_sitemap(site_meta)
+    gen_search_index(site_meta)
+    gen_compressed(site_meta)
+    prune_outputs()
+
+    save_manifest()
+    return {"changed": len(written_outputs),
+            "unchanged": len(new_manifest["outputs"]) - len(written_outputs),
+            "removed": len(removed_outputs)}
+
+def summary_string(summary):
+    """Formats the summary of outputs returned by [gen_site]."""
+    return "{changed} changed, {unchanged} unchanged, {removed} removed" \
+           .format(**summary)
+
+def watched_files():
+    """Returns a dictionary mapping every source file the build reads to its
+    (mtime, size), used by [serve] to notice changes: meta.md, the Markdown
+    files of posts and pages, the templates and the assets. Files that
+    disappear while they're listed (such as editor temporary files) are
+    left out."""
+    paths = ["meta.md"] + asset_paths()
+    for directory in [PostsDirectory, PagesDirectory]:
+        for root, dirs, filenames in os.walk(directory, followlinks=True):
+            root = root.rstrip("/") + "/"
+            paths += [root + filename for filename in filenames
+                      if os.path.splitext(filename)[1] == ".md"]
+    paths += [TemplatesDirectory + name + "-template.html"
+              for name in Templates]
+    files = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files[path] = (stat.st_mtime, stat.st_size)
+    return files
+
+def serve(port=8000, interval=0.5):
+    """Builds the site, serves it at http://localhost:[port]/, and rebuilds
+    whatever is affected every time a source file changes. Templates and
+    converted Markdown are kept in memory between rebuilds. Sources are
+    checked for changes every [interval] seconds. The server only listens
+    on localhost, as it serves every file in the site directory."""
+    import http.server, socketserver, threading
+
+    class DevServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+        """HTTP server handling each request on its own thread."""
+        daemon_threads = True
+
+    class DevRequestHandler(http.server.SimpleHTTPRequestHandler):
+        """Serves files from the site directory without logging every
+        request."""
+        def log_message(self, format, *args):
+            pass
+
+    site_url = "http://localhost:{}/".format(port)
+    gen_site(site_url=site_url)
+
+    server = DevServer(("localhost", port), DevRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print("Serving site at {} (press Ctrl+C to stop).".format(site_url))
+    print("Note: links point to this server; run 'nanosite build' before "
+          "uploading the site.")
+
+    files = watched_files()
+    try:
+        while True:
+            time.sleep(interval)
+            new_files = watched_files()
+            changed = set(path for path in set(files) | set(new_files)
+                          if files.get(path) != new_files.get(path))
+            if not changed:
+                continue
+            files = new_files
+            start = time.time()
+            try:
+                summary = gen_site(changed=changed, site_url=site_url)
+            except Exception as e:
+                print("nanosite: build failed: {}".format(e))
+                continue
+            print("Rebuilt site in {:.2f}s (outputs: {}).".format(
+                time.time() - start, summary_string(summary)))
+    except KeyboardInterrupt:
+        server.shutdown()
 
 def setup_blank_site(meta):
     def safe_mkdir(name):
@@ -344,14 +1635,14 @@ def setup_blank_site(meta):
     safe_mkdir(ArchiveDirectory)
 
     # Copy default templates
+    package = os.path.dirname(os.path.abspath(__file__))
     for name in Templates:
-        rsc_path = "templates/" + name + "-template.html"
-        src = pkg_resources.resource_filename(__name__, rsc_path)
-        shutil.copyfile(src, TemplatesDirectory + name + "-template.html")
+        filename = name + "-template.html"
+        shutil.copyfile(os.path.join(package, "templates", filename),
+                        TemplatesDirectory + filename)
 
     # Copy style.css
-    src = pkg_resources.resource_filename(__name__, "style.css")
-    shutil.copyfile(src, "style.css")
+    shutil.copyfile(os.path.join(package, "style.css"), "style.css")
 
     # Generate the site
     gen_site()
@@ -391,10 +1682,30 @@ def setup_site_interactive():
     else:
         print("Canceled.")
 
+def get_option(argv, name, default):
+    """Returns the value following option [name] in [argv], or [default] if
+    the option isn't given."""
+    if name not in argv:
+        return default
+    i = argv.index(name)
+    return argv[i + 1] if i + 1 < len(argv) else default
+
 def main(argv):
     def do_gen_site():
-        gen_site()
-        print("Generated site.")
+        jobs = get_option(argv, "--jobs", "1")
+        if not jobs.isdigit() or int(jobs) < 1:
+            print("nanosite: --jobs must be a positive number.")
+            return
+        profile_json = get_option(argv, "--profile-json", None)
+        if "--profile" in argv or profile_json is not None:
+            start_profile()
+        summary = gen_site(int(jobs), low_memory_mode="--low-memory" in argv)
+        print("Generated site ({}).".format(summary_string(summary)))
+        if profile is not None:
+            print()
+            print_profile()
+            if profile_json is not None:
+                save_profile(profile_json)
         
     cmd = argv[0].lower() if len(argv) >= 1 else ""
     if cmd == "":
@@ -407,9 +1718,21 @@ def main(argv):
         setup_site_interactive()
     elif cmd == "build":
         do_gen_site()
+    elif cmd == "serve":
+        port = get_option(argv, "--port", "8000")
+        if not port.isdigit():
+            print("nanosite: --port must be a number.")
+            return
+        serve(int(port))
     elif cmd == "--help":
         print("Usage: nanosite [command]. Valid commands:")
         print("  init -- Start a new site in this directory.")
         print("  build -- Build the site in this directory.")
+        print("    --jobs N -- Convert Markdown on N processes.")
+        print("    --low-memory -- Use less memory on very large sites.")
+        print("    --profile -- Print how long each stage of the build took.")
+        print("    --profile-json FILE -- Also write the timings to FILE.")
+        print("  serve -- Serve the site locally, rebuilding it on changes.")
+        print("    --port N -- Port to serve on (default 8000).")
     else:
         print("nanosite: Invalid option. See 'nanosite --help'.")
@@ -0,0 +1,98 @@
+// Client-side search for sites built by nanosite. Included in pages by the
+// $SEARCH_SCRIPT$ template hook.
+//
+// nanositeSearch(query) returns a Promise of the {title, url} of every post
+// and page containing all words of the query (the last one as a prefix).
+// If the page has an <input class="nanosite-search"> and an element with
+// class "nanosite-search-results", results are listed there as you type.
+(function() {
+  var script = document.currentScript;
+  var base = script.getAttribute("data-index");
+  var cache = {};
+
+  function load(name) {
+    if (!cache[name]) {
+      cache[name] = fetch(base + name + ".json").then(function(response) {
+        return response.ok ? response.json() : {};
+      });
+    }
+    return cache[name];
+  }
+
+  function shard(term) {
+    var c = term.charAt(0);
+    return /[a-z0-9]/.test(c) ? c : "_";
+  }
+
+  // Splits text into words like the index does: letters, digits and
+  // underscores, as Python's \w matches them, leaving out one-letter words
+  // and the stop words listed in docs.json.
+  function tokenize(text, stopWords) {
+    var terms = text.toLowerCase().split(/[^\p{L}\p{N}_]+/u);
+    return terms.filter(function(term) {
+      return term.length > 1 && stopWords.indexOf(term) < 0;
+    });
+  }
+
+  window.nanositeSearch = function(query) {
+    return load("docs").then(function(index) {
+      var terms = tokenize(query, index.stop_words || []);
+      if (terms.length === 0) {
+        return [];
+      }
+      var shards = terms.map(function(term) { return load(shard(term)); });
+      return Promise.all(shards).then(function(data) {
+        return match(index.docs, terms, data);
+      });
+    });
+  };
+
+  // Returns the documents of [docs] containing all [terms], given the index
+  // shard of each term in [data].
+  function match(docs, terms, data) {
+    var matches = null;
+    terms.forEach(function(term, i) {
+      var index = data[i];
+      var ids = {};
+      var last = i === terms.length - 1;
+      Object.keys(index).forEach(function(key) {
+        if (key === term || (last && key.indexOf(term) === 0)) {
+          index[key].forEach(function(id) { ids[id] = true; });
+        }
+      });
+      matches = matches === null ? ids : Object.keys(matches).reduce(
+        function(both, id) {
+          if (ids[id]) { both[id] = true; }
+          return both;
+        }, {});
+    });
+    return Object.keys(matches).map(function(id) {
+      return {title: docs[id][0], url: docs[id][1]};
+    });
+  }
+
+  document.addEventListener("DOMContentLoaded", function() {
+    var input = document.querySelector("input.nanosite-search");
+    var list = document.querySelector(".nanosite-search-results");
+    if (!input || !list) {
+      return;
+    }
+    input.addEventListener("input", function() {
+      var query = input.value;
+      nanositeSearch(query).then(function(results) {
+        if (input.value !== query) {
+          return;   // a newer search is on its way
+        }
+        list.innerHTML = "";
+        results.forEach(function(result) {
+          var item = document.createElement("li");
+          var link = document.createElement("a");
+          link.href = result.url;
+          link.textContent = result.title;
+          item.appendChild(link);
+          list.appendChild(item);
+        });
+      });
+    });
+  });
+})();
@@ -7,4 +7,5 @@ setup(name = "nanosite",
       author = "Andrew Wang",
       scripts = ["nanosite"],
       packages = ["nanosite_gen"],
-      package_data = {"nanosite_gen": ["templates/*.html", "style.css"]})
+      package_data = {"nanosite_gen": ["templates/*.html", "style.css",
+                                      "search.js"]})